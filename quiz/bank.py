@@ -0,0 +1,282 @@
+"""
+Скомпилированный банк вопросов в виде бинарного файла, отображаемого в память.
+
+Файл создаётся командой `manage.py compile_quiz_bank` и читается через mmap,
+поэтому все процессы WSGI-сервера используют одну копию в page cache,
+а запуск воркера не требует загрузки вопросов из базы.
+
+Снимок не обновляется сам: после изменения вопросов нужно перекомпилировать его.
+В заголовке хранится SHA-256 содержимого категорий, вопросов и вариантов;
+пока он не совпадает с базой (добавление, удаление, правка текста, перенос
+варианта к другому вопросу), вопросы читаются из базы.
+
+Формат (little-endian):
+
+    заголовок      magic, версия, число категорий, вопросов и вариантов,
+                   хеш содержимого, длина секции строк
+    категории      id, имя, первый индекс и число вопросов; отсортированы по id
+    индекс         номера записей вопросов, сгруппированные по категориям
+    вопросы        id, текст, первый индекс и число вариантов; отсортированы по id
+    варианты       id, текст
+    строки         тексты в UTF-8
+"""
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from django.conf import settings
+
+from .models import Category, Choice, Question
+from .types import BundleQuestion
+
+MAGIC = b"QZBK"
+VERSION = 3
+
+HEADER = struct.Struct("<4sHIII32sQ")
+CATEGORY = struct.Struct("<qIIII")
+INDEX = struct.Struct("<I")
+QUESTION = struct.Struct("<qIIII")
+CHOICE = struct.Struct("<qII")
+
+
+logger = logging.getLogger(__name__)
+
+
+class QuizBankError(Exception):
+    pass
+
+
+def content_rows() -> tuple[list[tuple], list[tuple], list[tuple]]:
+    """Категории, вопросы и варианты ответов в том виде, в каком они попадают в снимок."""
+    return (
+        list(Category.objects.order_by("id").values_list("id", "name")),
+        list(Question.objects.order_by("id").values_list("id", "category_id", "text")),
+        list(Choice.objects.order_by("id").values_list("id", "question_id", "text")),
+    )
+
+
+def content_digest(categories: list[tuple], questions: list[tuple], choices: list[tuple]) -> bytes:
+    digest = hashlib.sha256()
+    for rows in (categories, questions, choices):
+        for row in rows:
+            digest.update(json.dumps(row, ensure_ascii=False).encode("utf-8"))
+            digest.update(b"\n")
+        # Разделитель таблиц, чтобы строки не «перетекали» из одной в другую
+        digest.update(b"\0")
+    return digest.digest()
+
+
+def database_digest() -> bytes:
+    """Хеш текущего содержимого базы для проверки актуальности снимка."""
+    return content_digest(*content_rows())
+
+
+def compile_bank(path: str) -> tuple[int, int, int]:
+    """
+    Сериализует категории, вопросы и варианты ответов в файл снимка.
+
+    Файл сначала пишется во временный, а затем атомарно подменяет старый,
+    так что читатели всегда видят целый снимок.
+    Возвращает число категорий, вопросов и вариантов.
+    """
+    strings = bytearray()
+
+    def add_string(text: str) -> tuple[int, int]:
+        data = text.encode("utf-8")
+        offset = len(strings)
+        strings.extend(data)
+        return offset, len(data)
+
+    categories, questions, choices = content_rows()
+
+    choices_by_question: dict[int, list[tuple[int, str]]] = {}
+    for choice_id, question_id, text in choices:
+        choices_by_question.setdefault(question_id, []).append((choice_id, text))
+
+    questions_by_category: dict[int, list[int]] = {}
+    question_rows = []
+    choice_rows = []
+    for position, (question_id, category_id, text) in enumerate(questions):
+        questions_by_category.setdefault(category_id, []).append(position)
+        question_choices = choices_by_question.get(question_id, [])
+        question_rows.append((question_id, *add_string(text), len(choice_rows), len(question_choices)))
+        for choice_id, choice_text in question_choices:
+            choice_rows.append((choice_id, *add_string(choice_text)))
+
+    category_rows = []
+    index_rows: list[int] = []
+    for category_id, name in categories:
+        positions = questions_by_category.get(category_id, [])
+        category_rows.append((category_id, *add_string(name), len(index_rows), len(positions)))
+        index_rows.extend(positions)
+
+    data = bytearray(HEADER.pack(
+        MAGIC,
+        VERSION,
+        len(category_rows),
+        len(question_rows),
+        len(choice_rows),
+        content_digest(categories, questions, choices),
+        len(strings),
+    ))
+    for row in category_rows:
+        data += CATEGORY.pack(*row)
+    for position in index_rows:
+        data += INDEX.pack(position)
+    for row in question_rows:
+        data += QUESTION.pack(*row)
+    for row in choice_rows:
+        data += CHOICE.pack(*row)
+    data += strings
+
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile(dir=directory, prefix=".quiz_bank.", delete=False) as target:
+        try:
+            target.write(data)
+            target.flush()
+            os.fsync(target.fileno())
+        except BaseException:
+            os.unlink(target.name)
+            raise
+    os.chmod(target.name, 0o644)
+    os.replace(target.name, path)
+    return len(category_rows), len(question_rows), len(choice_rows)
+
+
+class QuizBank:
+    """Доступ только на чтение к файлу снимка без копирования его в память процесса."""
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as source:
+            if os.fstat(source.fileno()).st_size < HEADER.size:
+                raise QuizBankError(f"Файл {path} слишком короткий для снимка банка вопросов.")
+            self._mmap = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+
+        magic, version = struct.unpack_from("<4sH", self._buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise QuizBankError(f"Файл {path} не является снимком банка вопросов версии {VERSION}.")
+        (
+            _, _, self.category_count, self.question_count, self.choice_count,
+            self.digest, self._strings_length,
+        ) = HEADER.unpack_from(self._buffer, 0)
+
+        self._categories_offset = HEADER.size
+        self._index_offset = self._categories_offset + CATEGORY.size * self.category_count
+        self._questions_offset = self._index_offset + INDEX.size * self.question_count
+        self._choices_offset = self._questions_offset + QUESTION.size * self.question_count
+        self._strings_offset = self._choices_offset + CHOICE.size * self.choice_count
+        if len(self._buffer) != self._strings_offset + self._strings_length:
+            raise QuizBankError(f"Файл {path} повреждён или записан не полностью.")
+
+    def _string(self, offset: int, length: int) -> str:
+        if offset + length > self._strings_length:
+            raise QuizBankError("Строка выходит за пределы секции строк снимка.")
+        start = self._strings_offset + offset
+        return str(self._buffer[start:start + length], "utf-8")
+
+    def _search(self, base: int, record: struct.Struct, count: int, key: int) -> Optional[tuple]:
+        """Бинарный поиск записи по первому полю в отсортированной таблице."""
+        low, high = 0, count - 1
+        while low <= high:
+            middle = (low + high) // 2
+            row = record.unpack_from(self._buffer, base + middle * record.size)
+            if row[0] < key:
+                low = middle + 1
+            elif row[0] > key:
+                high = middle - 1
+            else:
+                return row
+        return None
+
+    def category_question_ids(self, category_id: int) -> Optional[list[int]]:
+        """Возвращает id вопросов категории или None, если категории нет в снимке."""
+        row = self._search(self._categories_offset, CATEGORY, self.category_count, category_id)
+        if row is None:
+            return None
+        _, _, _, first, count = row
+        if first + count > self.question_count:
+            raise QuizBankError(f"Индекс категории {category_id} выходит за пределы снимка.")
+        question_ids = []
+        for position in range(first, first + count):
+            (index,) = INDEX.unpack_from(self._buffer, self._index_offset + position * INDEX.size)
+            if index >= self.question_count:
+                raise QuizBankError(f"Индекс категории {category_id} выходит за пределы снимка.")
+            (question_id,) = struct.unpack_from("<q", self._buffer, self._questions_offset + index * QUESTION.size)
+            question_ids.append(question_id)
+        return question_ids
+
+    def get_question(self, question_id: int) -> Optional[BundleQuestion]:
+        row = self._search(self._questions_offset, QUESTION, self.question_count, question_id)
+        if row is None:
+            return None
+        _, text_offset, text_length, first, count = row
+        if first + count > self.choice_count:
+            raise QuizBankError(f"Варианты вопроса {question_id} выходят за пределы снимка.")
+        choices = []
+        for position in range(first, first + count):
+            choice_id, choice_offset, choice_length = CHOICE.unpack_from(
+                self._buffer, self._choices_offset + position * CHOICE.size
+            )
+            choices.append({"id": choice_id, "text": self._string(choice_offset, choice_length)})
+        return {"id": question_id, "text": self._string(text_offset, text_length), "choices": choices}
+
+
+_lock = threading.Lock()
+_bank: Optional[QuizBank] = None
+_bank_stat: Optional[tuple[int, int, int]] = None
+_bank_fresh = False
+_checked_at: Optional[float] = None
+
+
+def get_quiz_bank() -> Optional[QuizBank]:
+    """
+    Возвращает открытый снимок банка вопросов или None, если им нельзя пользоваться.
+
+    None возвращается, если файла нет, он повреждён или другой версии, либо
+    снимок устарел относительно базы; тогда вопросы читаются из базы.
+    Актуальность проверяется не чаще раза в QUIZ_BANK_CHECK_INTERVAL секунд.
+    После атомарной подмены файла снимок переоткрывается при следующем
+    обращении; уже выданные объекты продолжают читать старый файл.
+    """
+    global _bank, _bank_stat, _bank_fresh, _checked_at
+
+    path = getattr(settings, "QUIZ_BANK_PATH", None)
+    if not path:
+        return None
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        _bank, _bank_stat = None, None
+        return None
+
+    key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if key != _bank_stat:
+        with _lock:
+            if key != _bank_stat:
+                try:
+                    _bank = QuizBank(str(path))
+                except (QuizBankError, OSError, ValueError):
+                    # Запоминаем ключ, чтобы не разбирать испорченный файл на каждом запросе
+                    logger.exception("Не удалось открыть снимок банка вопросов %s", path)
+                    _bank = None
+                _bank_stat = key
+                _checked_at = None
+    if _bank is None:
+        return None
+
+    now = time.monotonic()
+    interval = getattr(settings, "QUIZ_BANK_CHECK_INTERVAL", 5)
+    if _checked_at is None or now - _checked_at >= interval:
+        fresh = _bank.digest == database_digest()
+        if not fresh and (_bank_fresh or _checked_at is None):
+            logger.warning("Снимок банка вопросов %s устарел, запустите compile_quiz_bank", path)
+        _bank_fresh, _checked_at = fresh, now
+    return _bank if _bank_fresh else None
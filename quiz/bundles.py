@@ -0,0 +1,107 @@
+import logging
+import random
+import struct
+from typing import Optional
+
+from django.core import signing
+
+from .bank import QuizBankError, get_quiz_bank
+from .models import Category
+from .types import BundleChoice, BundleQuestion, QuestionBundle
+
+# Сколько вопросов отдаётся клиенту за один запрос
+BUNDLE_SIZE = 5
+# Время жизни подписанного пакета в секундах
+BUNDLE_MAX_AGE = 60 * 60
+BUNDLE_SALT = "quiz.bundle"
+
+# Ошибки чтения повреждённого снимка, при которых вопросы берутся из базы
+BANK_READ_ERRORS = (QuizBankError, UnicodeDecodeError, struct.error)
+
+logger = logging.getLogger(__name__)
+
+
+def build_bundle(category: Category, exclude: list[int], size: int = BUNDLE_SIZE) -> QuestionBundle:
+    """
+    Собирает пакет из следующих `size` случайных вопросов категории.
+
+    В пакет попадают только тексты вопросов и вариантов ответов — признак
+    правильности остаётся на сервере. Список выданных вопросов подписывается,
+    чтобы при проверке ответов нельзя было подменить вопросы пакета.
+    """
+    items = get_bank_questions(category, exclude, size)
+    if items is None:
+        items = get_db_questions(category, exclude, size)
+
+    token = signing.dumps(
+        {"category": category.id, "questions": [item["id"] for item in items]},
+        salt=BUNDLE_SALT,
+        compress=True,
+    )
+    return {"token": token, "questions": items}
+
+
+def get_bank_questions(category: Category, exclude: list[int], size: int) -> Optional[list[BundleQuestion]]:
+    """Выбирает вопросы из скомпилированного снимка; None, если снимок недоступен или категории в нём нет."""
+    bank = get_quiz_bank()
+    if bank is None:
+        return None
+    try:
+        question_ids = bank.category_question_ids(category.id)
+        if question_ids is None:
+            return None
+
+        excluded = set(exclude)
+        remaining = [question_id for question_id in question_ids if question_id not in excluded]
+        picked = random.sample(remaining, min(size, len(remaining)))
+        return [question for question in map(bank.get_question, picked) if question is not None]
+    except BANK_READ_ERRORS:
+        logger.exception("Снимок банка вопросов повреждён, вопросы читаются из базы")
+        return None
+
+
+def has_remaining_questions(category: Category, exclude: list[int]) -> bool:
+    """Проверяет, остались ли вопросы, по тому же источнику, из которого собираются пакеты."""
+    bank = get_quiz_bank()
+    try:
+        question_ids = bank.category_question_ids(category.id) if bank is not None else None
+    except BANK_READ_ERRORS:
+        logger.exception("Снимок банка вопросов повреждён, вопросы читаются из базы")
+        question_ids = None
+    if question_ids is None:
+        return category.questions.exclude(id__in=exclude).exists()
+    excluded = set(exclude)
+    return any(question_id not in excluded for question_id in question_ids)
+
+
+def get_db_questions(category: Category, exclude: list[int], size: int) -> list[BundleQuestion]:
+    questions = (
+        category.questions
+        .exclude(id__in=exclude)
+        .order_by("?")
+        .prefetch_related("choices")[:size]
+    )
+    items: list[BundleQuestion] = []
+    for question in questions:
+        choices: list[BundleChoice] = [
+            {"id": choice.id, "text": choice.text}
+            for choice in question.choices.all()
+        ]
+        items.append({"id": question.id, "text": question.text, "choices": choices})
+    return items
+
+
+def load_bundle_token(token: str, category_id: int) -> Optional[set[int]]:
+    """
+    Проверяет подпись пакета и возвращает идентификаторы его вопросов.
+
+    Возвращает None, если подпись неверна, срок действия истёк
+    или пакет выдан для другой категории.
+    """
+    try:
+        payload = signing.loads(token, salt=BUNDLE_SALT, max_age=BUNDLE_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    if payload.get("category") != category_id:
+        return None
+    return set(payload.get("questions", []))
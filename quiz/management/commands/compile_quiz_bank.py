@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from quiz.bank import compile_bank
+
+
+class Command(BaseCommand):
+    help = (
+        "Компилирует категории, вопросы и варианты ответов в бинарный снимок, "
+        "который воркеры читают через mmap. Запускайте после изменения вопросов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            default=getattr(settings, "QUIZ_BANK_PATH", None),
+            help="Путь к файлу снимка (по умолчанию QUIZ_BANK_PATH).",
+        )
+
+    def handle(self, *args, **options):
+        path = options["output"]
+        if not path:
+            raise CommandError("Укажите --output или настройку QUIZ_BANK_PATH.")
+
+        categories, questions, choices = compile_bank(str(path))
+        self.stdout.write(self.style.SUCCESS(
+            f"Снимок {path}: категорий {categories}, вопросов {questions}, вариантов {choices}."
+        ))
@@ -1,3 +1,403 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from quiz_project.middleware import PRIMARY_PIN_COOKIE, accepted_encodings
+from quiz_project.routers import PrimaryReplicaRouter, RoutingState, routing_state
+from . import bank
+from .bank import HEADER, MAGIC, QuizBank, QuizBankError, compile_bank, get_quiz_bank
+from .bundles import build_bundle, has_remaining_questions
+from .models import Category, Choice, Question, QuizResult
+
+# В тестах DEBUG выключен, а манифест статики не собран
+TEST_STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+
+
+def create_category(name: str, questions: int) -> Category:
+    category = Category.objects.create(name=name)
+    for number in range(questions):
+        question = Question.objects.create(text=f"{name} {number}", category=category)
+        Choice.objects.create(question=question, text="Верно", is_correct=True)
+        Choice.objects.create(question=question, text="Неверно")
+    return category
+
+
+@override_settings(STORAGES=TEST_STORAGES, QUIZ_BANK_PATH=None)
+class SubmitAnswersTests(TestCase):
+    def setUp(self):
+        self.category = create_category("История", 7)
+        self.other_category = create_category("Музыка", 2)
+        self.url = reverse("submit_answers", args=[self.category.id])
+
+        response = self.client.get(reverse("quiz_view", args=[self.category.id]))
+        self.bundle = response.context["bundle"]
+
+    def answer(self, question_id: int, is_correct: bool, token: str = None) -> dict:
+        choice = Choice.objects.get(question_id=question_id, is_correct=is_correct)
+        return {"token": token or self.bundle["token"], "question": question_id, "choice": choice.id}
+
+    def submit(self, answers, prefetch: bool = False):
+        return self.client.post(
+            self.url,
+            json.dumps({"answers": answers, "prefetch": prefetch}),
+            content_type="application/json",
+        )
+
+    def test_bundle_has_no_correctness_data(self):
+        response = self.client.get(reverse("quiz_view", args=[self.category.id]))
+        self.assertNotIn("is_correct", json.dumps(response.context["bundle"]))
+        self.assertNotContains(response, '"is_correct"')
+
+    def test_correct_answers_are_scored(self):
+        question_ids = [question["id"] for question in self.bundle["questions"]]
+        response = self.submit([self.answer(question_id, True) for question_id in question_ids])
+
+        data = response.json()
+        self.assertEqual(data["score"], len(question_ids))
+        self.assertEqual(data["wrong_answers"], 0)
+        self.assertEqual([result["question"] for result in data["results"]], question_ids)
+
+    def test_forged_token_is_rejected(self):
+        answer = self.answer(self.bundle["questions"][0]["id"], True, token=self.bundle["token"][:-2] + "xx")
+        data = self.submit([answer]).json()
+        self.assertEqual(data["results"], [])
+        self.assertEqual(data["score"], 0)
+
+    def test_expired_token_is_rejected(self):
+        answer = self.answer(self.bundle["questions"][0]["id"], True)
+        with mock.patch("quiz.bundles.BUNDLE_MAX_AGE", -1):
+            data = self.submit([answer]).json()
+        self.assertEqual(data["results"], [])
+        self.assertEqual(data["score"], 0)
+
+    def test_question_from_another_category_is_rejected(self):
+        other_bundle = build_bundle(self.other_category, [])
+        other_question_id = other_bundle["questions"][0]["id"]
+
+        data = self.submit([
+            self.answer(other_question_id, True, token=other_bundle["token"]),
+            self.answer(other_question_id, True),
+        ]).json()
+        self.assertEqual(data["results"], [])
+        self.assertEqual(data["score"], 0)
+
+    def test_choice_from_another_question_is_rejected(self):
+        first, second = self.bundle["questions"][:2]
+        answer = self.answer(first["id"], True)
+        answer["question"] = second["id"]
+
+        data = self.submit([answer]).json()
+        self.assertEqual(data["results"], [])
+        self.assertEqual(data["score"], 0)
+
+    def test_out_of_range_choice_id_is_rejected(self):
+        question_id = self.bundle["questions"][0]["id"]
+        for choice_id in [2 ** 63, 10 ** 20, -(2 ** 63) - 1]:
+            response = self.submit([{"token": self.bundle["token"], "question": question_id, "choice": choice_id}])
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["results"], [])
+        self.assertEqual(self.submit([self.answer(question_id, True)]).json()["score"], 1)
+
+    def test_duplicate_answer_is_scored_once(self):
+        answer = self.answer(self.bundle["questions"][0]["id"], True)
+        self.assertEqual(self.submit([answer, answer]).json()["score"], 1)
+        self.assertEqual(self.submit([answer]).json()["score"], 1)
+
+    def test_deleted_question_is_released(self):
+        question_id = self.bundle["questions"][0]["id"]
+        answer = self.answer(question_id, True)
+        Question.objects.filter(id=question_id).delete()
+
+        data = self.submit([answer]).json()
+        self.assertEqual(data["results"], [])
+        self.assertNotIn(question_id, self.client.session["reserved_questions"])
+
+    def test_bool_ids_are_rejected(self):
+        data = self.submit([{"token": self.bundle["token"], "question": True, "choice": True}]).json()
+        self.assertEqual(data["results"], [])
+        self.assertNotIn(True, self.client.session["asked_questions"])
+
+    def test_quiz_finishes_after_three_wrong_answers(self):
+        question_ids = [question["id"] for question in self.bundle["questions"]][:4]
+        data = self.submit([self.answer(question_id, False) for question_id in question_ids], prefetch=True).json()
+
+        self.assertEqual(data["wrong_answers"], 3)
+        self.assertEqual(len(data["results"]), 3)
+        self.assertTrue(data["finished"])
+        self.assertIsNone(data["bundle"])
+
+    def test_prefetch_returns_next_bundle(self):
+        question_ids = [question["id"] for question in self.bundle["questions"]]
+        data = self.submit([self.answer(question_ids[0], True)], prefetch=True).json()
+
+        next_ids = [question["id"] for question in data["bundle"]["questions"]]
+        self.assertEqual(len(next_ids), 2)
+        self.assertFalse(set(next_ids) & set(question_ids))
+
+    def test_malformed_body_returns_400(self):
+        for body in ["не json", json.dumps([]), json.dumps({}), json.dumps({"answers": "все"})]:
+            response = self.client.post(self.url, body, content_type="application/json")
+            self.assertEqual(response.status_code, 400, body)
+
+    def test_quiz_not_started_returns_400(self):
+        url = reverse("submit_answers", args=[self.other_category.id])
+        response = self.client.post(url, json.dumps({"answers": []}), content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+class AcceptEncodingTests(TestCase):
+    def test_explicit_encodings(self):
+        self.assertEqual(accepted_encodings("gzip, deflate, br"), {"gzip", "br"})
+        self.assertEqual(accepted_encodings("br;q=0, gzip;q=0.5"), {"gzip"})
+        self.assertEqual(accepted_encodings(""), set())
+
+    def test_wildcard_does_not_override_refused_encoding(self):
+        self.assertEqual(accepted_encodings("*"), {"gzip", "br"})
+        self.assertEqual(accepted_encodings("gzip;q=0, *"), {"br"})
+        self.assertEqual(accepted_encodings("br, *;q=0"), {"br"})
+
+
+class PrecompressedStaticMiddlewareTests(TestCase):
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root)
+        self.name = "app.0123456789ab.js"
+        with open(os.path.join(self.static_root, self.name), "w") as target:
+            target.write("console.log('quiz');" * 20)
+        with open(os.path.join(self.static_root, self.name + ".gz"), "wb") as target:
+            target.write(b"gzip")
+
+        storages = {
+            **TEST_STORAGES,
+            "staticfiles": {"BACKEND": "quiz_project.storage.CompressedManifestStaticFilesStorage"},
+        }
+        settings_override = override_settings(STATIC_ROOT=self.static_root, STORAGES=storages)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_precompressed_variant(self):
+        response = self.client.get(f"/static/{self.name}", HTTP_ACCEPT_ENCODING="gzip;q=0, *")
+        self.assertNotIn("Content-Encoding", response)
+
+        response = self.client.get(f"/static/{self.name}", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(b"".join(response.streaming_content), b"gzip")
+
+    def test_manifest_is_reread_after_collectstatic(self):
+        response = self.client.get(f"/static/{self.name}")
+        self.assertEqual(response["Cache-Control"], "public, max-age=60")
+
+        with open(os.path.join(self.static_root, "staticfiles.json"), "w") as manifest:
+            json.dump({"version": "1.1", "paths": {"app.js": self.name}}, manifest)
+        response = self.client.get(f"/static/{self.name}")
+        self.assertIn("immutable", response["Cache-Control"])
+
+    def test_corrupt_manifest_disables_immutable_caching(self):
+        with open(os.path.join(self.static_root, "staticfiles.json"), "w") as manifest:
+            manifest.write('{"version": "1.1", "paths": {"app.js": ')
+        with self.assertLogs("quiz_project.middleware", "ERROR"):
+            response = self.client.get(f"/static/{self.name}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Cache-Control"], "public, max-age=60")
+
+    def test_debug_passes_through(self):
+        with override_settings(DEBUG=True):
+            response = self.client.get(f"/static/{self.name}", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertNotIn("Content-Encoding", response)
+        self.assertNotIn("Cache-Control", response)
+
+
+class QuizBankTests(TestCase):
+    fixtures = [
+        "category_art", "category_cinema", "category_culture", "category_fashion",
+        "category_geography", "category_history", "category_literature", "category_music",
+        "category_philosophy", "category_science", "category_sport", "category_tech",
+    ]
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "quiz_bank.bin")
+
+        settings_override = override_settings(QUIZ_BANK_PATH=self.path, QUIZ_BANK_CHECK_INTERVAL=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # Сбрасываем кеш открытого снимка между тестами
+        bank._bank_stat = None
+
+    def write(self, data: bytes) -> None:
+        with open(self.path, "wb") as target:
+            target.write(data)
+
+    def test_round_trip(self):
+        empty = Category.objects.create(name="Пустая")
+        compile_bank(self.path)
+        quiz_bank = QuizBank(self.path)
+
+        for category in Category.objects.all():
+            self.assertCountEqual(
+                quiz_bank.category_question_ids(category.id),
+                category.questions.values_list("id", flat=True),
+            )
+        for question in Question.objects.all():
+            self.assertEqual(quiz_bank.get_question(question.id), {
+                "id": question.id,
+                "text": question.text,
+                "choices": [
+                    {"id": choice.id, "text": choice.text}
+                    for choice in question.choices.order_by("id")
+                ],
+            })
+        self.assertEqual(quiz_bank.category_question_ids(empty.id), [])
+
+    def test_missing_ids(self):
+        compile_bank(self.path)
+        quiz_bank = QuizBank(self.path)
+        self.assertIsNone(quiz_bank.get_question(10 ** 9))
+        self.assertIsNone(quiz_bank.category_question_ids(10 ** 9))
+
+    def test_bad_magic_and_version_are_rejected(self):
+        for header in [
+            HEADER.pack(b"JUNK", bank.VERSION, 0, 0, 0, b"", 0),
+            HEADER.pack(MAGIC, bank.VERSION + 1, 0, 0, 0, b"", 0),
+            b"QZ",
+        ]:
+            self.write(header)
+            with self.assertRaises(QuizBankError):
+                QuizBank(self.path)
+
+    def test_corrupt_snapshot_falls_back_to_database(self):
+        self.write(b"junk" * 100)
+        with self.assertLogs("quiz.bank", "ERROR"):
+            self.assertIsNone(get_quiz_bank())
+
+        # Испорченный файл не разбирается повторно на каждом запросе
+        with mock.patch("quiz.bank.QuizBank") as quiz_bank_class:
+            self.assertIsNone(get_quiz_bank())
+        quiz_bank_class.assert_not_called()
+
+        category = Category.objects.first()
+        self.assertEqual(len(build_bundle(category, [], size=2)["questions"]), 2)
+
+    def test_stale_snapshot_is_not_used(self):
+        compile_bank(self.path)
+        self.assertIsNotNone(get_quiz_bank())
+
+        category = Category.objects.first()
+        question_ids = list(category.questions.values_list("id", flat=True))
+        Question.objects.filter(id=question_ids[0]).delete()
+        added = Question.objects.create(text="Новый вопрос", category=category)
+
+        with self.assertLogs("quiz.bank", "WARNING"):
+            self.assertIsNone(get_quiz_bank())
+        bundle = build_bundle(category, [], size=10)
+        self.assertCountEqual([question["id"] for question in bundle["questions"]], question_ids[1:] + [added.id])
+        self.assertTrue(has_remaining_questions(category, question_ids))
+
+        compile_bank(self.path)
+        self.assertIsNotNone(get_quiz_bank())
+
+    def test_edited_content_makes_snapshot_stale(self):
+        first, second = Question.objects.order_by("id")[:2]
+        for edit in [
+            lambda: Question.objects.filter(id=first.id).update(text="Исправленный текст"),
+            lambda: first.choices.filter(id=first.choices.first().id).update(question=second),
+            lambda: Category.objects.filter(id=first.category_id).update(name="Новое имя"),
+        ]:
+            compile_bank(self.path)
+            self.assertIsNotNone(get_quiz_bank())
+            edit()
+            with self.assertLogs("quiz.bank", "WARNING"):
+                self.assertIsNone(get_quiz_bank())
+
+    def test_truncated_strings_are_rejected(self):
+        compile_bank(self.path)
+        with open(self.path, "rb") as source:
+            data = source.read()
+        self.write(data[:-10])
+        with self.assertRaises(QuizBankError):
+            QuizBank(self.path)
+
+    def test_invalid_strings_fall_back_to_database(self):
+        compile_bank(self.path)
+        quiz_bank = QuizBank(self.path)
+        strings_offset = quiz_bank._strings_offset
+        del quiz_bank
+        with open(self.path, "r+b") as target:
+            size = target.seek(0, os.SEEK_END)
+            target.seek(strings_offset)
+            target.write(b"\xff" * (size - strings_offset))
+
+        category = Category.objects.first()
+        with self.assertLogs("quiz.bundles", "ERROR"):
+            bundle = build_bundle(category, [], size=2)
+        self.assertEqual(len(bundle["questions"]), 2)
+        self.assertTrue(all(question["text"] for question in bundle["questions"]))
+
+
+@override_settings(STORAGES=TEST_STORAGES, QUIZ_BANK_PATH=None, DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTests(TestCase):
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        # Разные данные в базах показывают, откуда было чтение
+        Category.objects.create(name="Из основной базы")
+        Category.objects.using("replica").create(name="Из реплики")
+
+    def test_category_list_reads_from_replica(self):
+        response = self.client.get(reverse("category_list"))
+        self.assertContains(response, "Из реплики")
+        self.assertNotContains(response, "Из основной базы")
+
+    def test_leaderboard_reads_from_replica(self):
+        QuizResult.objects.using("replica").create(name="Реплика", email="replica@example.com", score=1)
+        response = self.client.get(reverse("leaderboard_partial"))
+        self.assertContains(response, "replica@example.com")
+
+    def test_quiz_end_writes_to_primary_and_pins(self):
+        response = self.client.post(reverse("quiz_end"), {"name": "Игрок", "email": "player@example.com"})
+
+        self.assertTrue(QuizResult.objects.using("default").filter(email="player@example.com").exists())
+        self.assertFalse(QuizResult.objects.using("replica").filter(email="player@example.com").exists())
+        # Рейтинг после записи читается из основной базы
+        self.assertContains(response, "player@example.com")
+        self.assertIn(PRIMARY_PIN_COOKIE, response.cookies)
+
+        response = self.client.get(reverse("leaderboard_partial"))
+        self.assertContains(response, "player@example.com")
+
+    def test_pinned_request_reads_from_primary(self):
+        self.client.cookies[PRIMARY_PIN_COOKIE] = "1"
+        response = self.client.get(reverse("category_list"))
+        self.assertContains(response, "Из основной базы")
+        self.assertNotContains(response, "Из реплики")
+
+    def test_read_only_request_does_not_pin(self):
+        response = self.client.get(reverse("category_list"))
+        self.assertNotIn(PRIMARY_PIN_COOKIE, response.cookies)
+
+    @override_settings(DATABASE_REPLICAS=["replica", "replica_2", "replica_3"])
+    def test_replica_is_chosen_once_per_request(self):
+        router = PrimaryReplicaRouter()
+        token = routing_state.set(RoutingState(use_replicas=True))
+        try:
+            aliases = {
+                router.db_for_read(model)
+                for _ in range(20)
+                for model in (Category, Question, Choice, QuizResult)
+            }
+        finally:
+            routing_state.reset(token)
+        self.assertEqual(len(aliases), 1)
@@ -2,7 +2,7 @@ from typing import TypedDict, List, Optional
 
 from django import forms
 
-from .models import Category, Question
+from .models import Category
 
 
 class BaseContext(TypedDict):
@@ -13,11 +13,27 @@ class CategoryListContext(TypedDict):
     categories: List[Category]
 
 
+class BundleChoice(TypedDict):
+    id: int
+    text: str
+
+
+class BundleQuestion(TypedDict):
+    id: int
+    text: str
+    choices: List[BundleChoice]
+
+
+class QuestionBundle(TypedDict):
+    token: str
+    questions: List[BundleQuestion]
+
+
 class QuizContext(BaseContext):
-    question: Question
+    question: BundleQuestion
+    bundle: QuestionBundle
     score: int
     wrong_answers: int
-    previous_is_correct: Optional[bool]
 
 
 class CheckAnswerContext(BaseContext):
@@ -30,6 +46,19 @@ class NoQuestionsContext(BaseContext):
     pass
 
 
+class AnswerResult(TypedDict):
+    question: int
+    is_correct: bool
+
+
+class SubmitAnswersResponse(TypedDict):
+    results: List[AnswerResult]
+    score: int
+    wrong_answers: int
+    finished: bool
+    bundle: Optional[QuestionBundle]
+
+
 class QuizEndContext(TypedDict):
     score: int
     wrong_answers: int
@@ -5,7 +5,7 @@ urlpatterns = [
     path("", views.category_list, name="category_list"),
     path("quiz/<int:category_id>/", views.quiz_view, name="quiz_view"),
     path(
-        "quiz/<int:category_id>/check_answer/", views.check_answer, name="check_answer"
+        "quiz/<int:category_id>/submit_answers/", views.submit_answers, name="submit_answers"
     ),
     path("quiz/end", views.quiz_end, name="quiz_end"),
     path('leaderboard_partial/', views.leaderboard_partial, name='leaderboard_partial'),
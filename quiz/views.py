@@ -1,15 +1,18 @@
+import json
 from datetime import timedelta
 from typing import Optional
 
 from django.db.models import Max
-from django.http import HttpRequest, HttpResponse
+from django.http import HttpRequest, HttpResponse, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse
 from django.utils import timezone
+from django.views.decorators.http import require_POST
 
+from .bundles import build_bundle, has_remaining_questions, load_bundle_token
 from .forms import QuizResultForm
 from .models import Question, Choice, Category, QuizResult
-from .types import CategoryListContext, QuizContext
+from .types import AnswerResult, CategoryListContext, QuestionBundle, QuizContext, SubmitAnswersResponse
 
 
 def category_list(request: HttpRequest) -> HttpResponse:
@@ -26,12 +29,26 @@ def init_quiz_session(request: HttpRequest, category_id: int) -> None:
     request.session["score"] = 0
     request.session["wrong_answers"] = 0
     request.session["asked_questions"] = []
+    request.session["reserved_questions"] = []
 
 
-def get_next_question(category: Category, asked_questions: list[int]) -> Optional[Question]:
-    """Возвращает следующий случайный вопрос из категории, который ещё не задавался."""
-    remaining_questions = category.questions.exclude(id__in=asked_questions)
-    return remaining_questions.order_by("?").first()
+def get_session_list(request: HttpRequest, key: str) -> list[int]:
+    """Возвращает список идентификаторов из сессии, восстанавливая его при повреждении."""
+    value = request.session.get(key, [])
+    if not isinstance(value, list):
+        value = []
+        request.session[key] = value
+    return value
+
+
+def reserve_bundle(request: HttpRequest, category: Category) -> QuestionBundle:
+    """Выдаёт пакет следующих вопросов и резервирует их в сессии до получения ответов."""
+    asked_questions = get_session_list(request, "asked_questions")
+    reserved_questions = get_session_list(request, "reserved_questions")
+    bundle = build_bundle(category, asked_questions + reserved_questions)
+    reserved_questions.extend(question["id"] for question in bundle["questions"])
+    request.session["reserved_questions"] = reserved_questions
+    return bundle
 
 
 def quiz_view(request: HttpRequest, category_id: int) -> HttpResponse:
@@ -42,75 +59,127 @@ def quiz_view(request: HttpRequest, category_id: int) -> HttpResponse:
     if "category_id" not in request.session or request.session.get("category_id") != category_id:
         init_quiz_session(request, category_id)
 
-    asked_questions = request.session.get("asked_questions", [])
-    if not isinstance(asked_questions, list):
-        asked_questions = []
-        request.session["asked_questions"] = asked_questions
-
-    # Проверяем, есть ли в категории вопросы
-    if not category.questions.exists():
-        # Нет вопросов - сразу конец квиза
-        return redirect(reverse("quiz_end"))
+    # Вопросы, выданные до перезагрузки страницы, клиенту уже недоступны
+    request.session["reserved_questions"] = []
 
-    # Получаем следующий вопрос
-    question = get_next_question(category, asked_questions)
-    if not question:
-        # Если вопросов не осталось
+    # Первый пакет вопросов встраивается прямо в страницу
+    bundle = reserve_bundle(request, category)
+    if not bundle["questions"]:
+        # Вопросов не осталось - сразу конец квиза
         return redirect(reverse("quiz_end"))
 
-    # Добавляем текущий вопрос в список уже заданных
-    asked_questions.append(question.id)
-    request.session["asked_questions"] = asked_questions
-
     context: QuizContext = {
-        "question": question,
+        "question": bundle["questions"][0],
+        "bundle": bundle,
         "category": category,
         "score": request.session["score"],
         "wrong_answers": request.session["wrong_answers"],
-        "previous_is_correct": None,
     }
     return render(request, "quiz/quiz.html", context)
 
 
-def check_answer(request: HttpRequest, category_id: int) -> HttpResponse:
-    choice_id = request.POST.get("choice")
-    if not choice_id:
-        return redirect(reverse("quiz_view", args=[category_id]))
+@require_POST
+def submit_answers(request: HttpRequest, category_id: int) -> JsonResponse:
+    """
+    Принимает пачку ответов на вопросы из выданных пакетов и начисляет очки.
 
-    choice = get_object_or_404(Choice, id=choice_id)
+    Каждый ответ засчитывается только один раз, только для вопроса из подписанного
+    пакета этой категории и только для варианта, принадлежащего этому вопросу.
+    """
     category = get_object_or_404(Category, id=category_id)
+    if request.session.get("category_id") != category_id:
+        return JsonResponse({"error": "Квиз по этой категории не начат."}, status=400)
+
+    try:
+        data = json.loads(request.body)
+        answers = data["answers"]
+        if not isinstance(answers, list):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"error": "Некорректный формат ответов."}, status=400)
+
+    asked_questions = get_session_list(request, "asked_questions")
+    reserved_questions = get_session_list(request, "reserved_questions")
+
+    # Отбираем ответы на вопросы из подлинных пакетов
+    bundle_questions: dict[str, Optional[set[int]]] = {}
+    submitted: list[tuple[int, int]] = []
+    for answer in answers:
+        if not isinstance(answer, dict):
+            continue
+        token = answer.get("token")
+        question_id = answer.get("question")
+        choice_id = answer.get("choice")
+        # bool в Python - подкласс int, поэтому JSON true/false отсекаем явно
+        if not isinstance(token, str) or type(question_id) is not int or type(choice_id) is not int:
+            continue
+        if token not in bundle_questions:
+            bundle_questions[token] = load_bundle_token(token, category_id)
+        question_ids = bundle_questions[token]
+        if question_ids is None or question_id not in question_ids:
+            continue
+        submitted.append((question_id, choice_id))
+
+    # В запросы к базе попадают только id вопросов из подписанных пакетов,
+    # id вариантов от клиента лишь ищутся в загруженном словаре
+    submitted_questions = {question_id for question_id, _ in submitted}
+    choices = {
+        choice_id: (question_id, is_correct)
+        for choice_id, question_id, is_correct in Choice.objects.filter(
+            question_id__in=submitted_questions
+        ).values_list("id", "question_id", "is_correct")
+    }
+    existing_questions = set(
+        Question.objects.filter(id__in=submitted_questions).values_list("id", flat=True)
+    )
 
-    # Обновление счёта
-    if choice.is_correct:
-        request.session["score"] = request.session.get("score", 0) + 1
-    else:
-        request.session["wrong_answers"] = request.session.get("wrong_answers", 0) + 1
-
-    # Проверка предела неправильных ответов
-    if request.session["wrong_answers"] >= 3:
-        return redirect(reverse("quiz_end"))
-
-    asked_questions = request.session.get("asked_questions", [])
-    if not isinstance(asked_questions, list):
-        asked_questions = []
-        request.session["asked_questions"] = asked_questions
-
-    # Получаем следующий вопрос
-    question = get_next_question(category, asked_questions)
-    if not question:
-        return redirect(reverse("quiz_end"))
+    score = request.session.get("score", 0)
+    wrong_answers = request.session.get("wrong_answers", 0)
+    results: list[AnswerResult] = []
+    for question_id, choice_id in submitted:
+        # Проверка предела неправильных ответов
+        if wrong_answers >= 3:
+            break
+        # Повторный ответ на тот же вопрос не засчитывается
+        if question_id not in reserved_questions:
+            continue
+        # Вопрос удалён после выдачи пакета - снимаем резерв, ответ не засчитывается
+        if question_id not in existing_questions:
+            reserved_questions.remove(question_id)
+            continue
+        choice = choices.get(choice_id)
+        if choice is None or choice[0] != question_id:
+            continue
+
+        is_correct = choice[1]
+        if is_correct:
+            score += 1
+        else:
+            wrong_answers += 1
+        reserved_questions.remove(question_id)
+        asked_questions.append(question_id)
+        results.append({"question": question_id, "is_correct": is_correct})
 
-    asked_questions.append(question.id)
+    request.session["score"] = score
+    request.session["wrong_answers"] = wrong_answers
     request.session["asked_questions"] = asked_questions
-
-    context: QuizContext = {
-        "question": question,
-        "category": category,
-        "score": request.session.get("score", 0),
-        "wrong_answers": request.session.get("wrong_answers", 0),
-        "previous_is_correct": choice.is_correct,
+    request.session["reserved_questions"] = reserved_questions
+
+    finished = wrong_answers >= 3
+    bundle = None
+    if not finished and data.get("prefetch"):
+        bundle = reserve_bundle(request, category)
+    if not finished and not request.session["reserved_questions"]:
+        finished = not has_remaining_questions(category, asked_questions)
+
+    response: SubmitAnswersResponse = {
+        "results": results,
+        "score": score,
+        "wrong_answers": wrong_answers,
+        "finished": finished,
+        "bundle": bundle,
     }
-    return render(request, "quiz/quiz.html", context)
+    return JsonResponse(response)
 
 
 def quiz_end(request: HttpRequest) -> HttpResponse:
@@ -0,0 +1,173 @@
+import json
+import logging
+import mimetypes
+import os
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, HttpRequest, HttpResponse
+from django.utils._os import safe_join
+from django.utils.module_loading import import_string
+
+from .routers import RoutingState, routing_state
+
+logger = logging.getLogger(__name__)
+
+# Файлы с хешем в имени никогда не меняются, их можно кешировать навсегда
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+# Файлы без хеша могут обновиться при следующем деплое
+DEFAULT_MAX_AGE = 60
+
+# Порядок важен: brotli сжимает лучше, поэтому предпочитается
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def parse_accept_encoding(header: str) -> dict[str, float]:
+    """Возвращает кодировки из заголовка Accept-Encoding с их весами q."""
+    qualities = {}
+    for part in header.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name] = quality
+    return qualities
+
+
+def accepted_encodings(header: str) -> set[str]:
+    """
+    Возвращает поддерживаемые клиентом кодировки из ENCODINGS.
+
+    Явно указанная кодировка важнее `*`, поэтому `gzip;q=0, *` запрещает gzip.
+    """
+    qualities = parse_accept_encoding(header)
+    default = qualities.get("*", 0.0)
+    return {encoding for encoding, _ in ENCODINGS if qualities.get(encoding, default) > 0}
+
+
+class PrecompressedStaticMiddleware:
+    """
+    Отдаёт собранную статику из STATIC_ROOT без CDN и внешнего веб-сервера.
+
+    Если клиент поддерживает brotli или gzip и `collectstatic` подготовил
+    сжатую копию файла, отдаётся она. Файлы с хешем в имени получают
+    заголовки для бессрочного кеширования.
+
+    При DEBUG=True middleware ничего не делает: статику из исходных каталогов
+    отдаёт runserver, и устаревшие копии из STATIC_ROOT не перекрывают правки.
+    """
+
+    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]) -> None:
+        self.get_response = get_response
+        self.static_url = settings.STATIC_URL
+        self.static_root = str(settings.STATIC_ROOT) if settings.STATIC_ROOT else None
+        self._immutable_names: set[str] = set()
+        self._manifest_mtime: Optional[int] = None
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if (
+            settings.DEBUG
+            or self.static_root is None
+            or request.method not in ("GET", "HEAD")
+            or not request.path.startswith(self.static_url)
+        ):
+            return self.get_response(request)
+
+        name = request.path[len(self.static_url):]
+        try:
+            path = safe_join(self.static_root, name)
+        except SuspiciousFileOperation:
+            return self.get_response(request)
+        if not os.path.isfile(path):
+            return self.get_response(request)
+
+        accepted = accepted_encodings(request.headers.get("Accept-Encoding", ""))
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        for encoding, suffix in ENCODINGS:
+            if encoding in accepted and os.path.isfile(path + suffix):
+                response = FileResponse(open(path + suffix, "rb"), content_type=content_type)
+                response["Content-Encoding"] = encoding
+                break
+        else:
+            response = FileResponse(open(path, "rb"), content_type=content_type)
+
+        # FileResponse подставляет имя файла, для статики оно не нужно
+        del response["Content-Disposition"]
+        response["Vary"] = "Accept-Encoding"
+        if name in self.immutable_names:
+            response["Cache-Control"] = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+        else:
+            response["Cache-Control"] = f"public, max-age={DEFAULT_MAX_AGE}"
+        return response
+
+    @property
+    def immutable_names(self) -> set[str]:
+        """Имена файлов с хешем из манифеста; перечитываются после нового collectstatic."""
+        # Имя берётся из класса хранилища: его экземпляр сам читает манифест
+        # при создании и падает, если файл испорчен
+        backend = import_string(settings.STORAGES["staticfiles"]["BACKEND"])
+        manifest_name = getattr(backend, "manifest_name", None)
+        if manifest_name is None:
+            return set()
+        manifest_path = os.path.join(self.static_root, manifest_name)
+        try:
+            mtime = os.stat(manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return set()
+        if mtime != self._manifest_mtime:
+            try:
+                with open(manifest_path, encoding="utf-8") as manifest:
+                    self._immutable_names = set(json.load(manifest).get("paths", {}).values())
+            except (ValueError, OSError, AttributeError):
+                # Недописанный или испорченный манифест не должен ронять отдачу статики:
+                # файлы отдаются с коротким кешем до следующего collectstatic
+                logger.exception("Не удалось прочитать манифест статики %s", manifest_path)
+                self._immutable_names = set()
+            self._manifest_mtime = mtime
+        return self._immutable_names
+
+
+# Сколько секунд после записи клиент читает из основной базы, пока реплики догоняют
+REPLICA_LAG_SECONDS = 5
+PRIMARY_PIN_COOKIE = "use_primary_db"
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Разрешает чтение с реплик в представлениях из REPLICA_READ_VIEWS.
+
+    Если запрос что-то записал, клиент получает короткоживущую cookie,
+    и его следующие запросы читают из основной базы, пока реплики догоняют.
+    """
+
+    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]) -> None:
+        self.get_response = get_response
+        self.read_views = set(getattr(settings, "REPLICA_READ_VIEWS", []))
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        state = RoutingState(pinned=PRIMARY_PIN_COOKIE in request.COOKIES)
+        token = routing_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            routing_state.reset(token)
+
+        if state.wrote:
+            response.set_cookie(
+                PRIMARY_PIN_COOKIE, "1", max_age=REPLICA_LAG_SECONDS, httponly=True, samesite="Lax"
+            )
+        return response
+
+    def process_view(self, request: HttpRequest, view_func, view_args, view_kwargs) -> None:
+        state = routing_state.get()
+        if state is not None and request.resolver_match.url_name in self.read_views:
+            state.use_replicas = True
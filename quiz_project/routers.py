@@ -0,0 +1,61 @@
+import random
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+@dataclass
+class RoutingState:
+    # Запрос обрабатывается представлением, которое только читает контент
+    use_replicas: bool = False
+    # После записи чтения идут в основную базу, чтобы видеть свои изменения
+    pinned: bool = False
+    wrote: bool = False
+    # Реплика выбирается один раз на запрос, чтобы все чтения видели одно состояние
+    replica: Optional[str] = None
+
+
+# Состояние текущего запроса, выставляется ReplicaRoutingMiddleware
+routing_state: ContextVar[Optional[RoutingState]] = ContextVar("routing_state", default=None)
+
+
+class PrimaryReplicaRouter:
+    """
+    Направляет чтения моделей квиза на реплики из DATABASE_REPLICAS.
+
+    Реплики используются только в представлениях из REPLICA_READ_VIEWS и только
+    до первой записи в запросе. Все записи, а также сессии, пользователи
+    и прочие модели других приложений работают с основной базой.
+    """
+
+    route_app_labels = {"quiz"}
+
+    def db_for_read(self, model, **hints) -> Optional[str]:
+        if model._meta.app_label not in self.route_app_labels:
+            return None
+        state = routing_state.get()
+        replicas = getattr(settings, "DATABASE_REPLICAS", [])
+        if state is None or not state.use_replicas or state.pinned or not replicas:
+            return DEFAULT_DB_ALIAS
+
+        if state.replica not in replicas:
+            state.replica = random.choice(replicas)
+        return state.replica
+
+    def db_for_write(self, model, **hints) -> Optional[str]:
+        if model._meta.app_label not in self.route_app_labels:
+            return None
+        state = routing_state.get()
+        if state is not None:
+            state.pinned = True
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints) -> Optional[bool]:
+        databases = {DEFAULT_DB_ALIAS, *getattr(settings, "DATABASE_REPLICAS", [])}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
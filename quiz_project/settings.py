@@ -43,8 +43,10 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "quiz_project.middleware.PrecompressedStaticMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
+    "quiz_project.middleware.ReplicaRoutingMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
@@ -82,6 +84,32 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения. Локально можно проверить на копии основной базы:
+#   cp db.sqlite3 db.replica.sqlite3
+#   QUIZ_REPLICA_DB=db.replica.sqlite3 python manage.py runserver
+# Без QUIZ_REPLICA_DB псевдоним replica указывает на основную базу и не используется.
+DATABASES["replica"] = {
+    "ENGINE": "django.db.backends.sqlite3",
+    "NAME": BASE_DIR / os.environ.get("QUIZ_REPLICA_DB", "db.sqlite3"),
+}
+DATABASE_REPLICAS = ["replica"] if os.environ.get("QUIZ_REPLICA_DB") else []
+
+DATABASE_ROUTERS = ["quiz_project.routers.PrimaryReplicaRouter"]
+
+# Представления, которые только читают вопросы и рейтинг и могут ходить в реплики
+REPLICA_READ_VIEWS = [
+    "category_list",
+    "quiz_view",
+    "submit_answers",
+    "leaderboard_partial",
+]
+
+# Снимок банка вопросов, создаётся командой `manage.py compile_quiz_bank`.
+# Пока файла нет или он устарел, вопросы читаются из базы.
+QUIZ_BANK_PATH = BASE_DIR / "quiz_bank.bin"
+# Как часто (в секундах) сверять снимок с базой
+QUIZ_BANK_CHECK_INTERVAL = 5
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -116,6 +144,17 @@ USE_TZ = True
 
 STATIC_URL = "/static/"
 STATICFILES_DIRS = [os.path.join(BASE_DIR, "static")]
+STATIC_ROOT = BASE_DIR / "staticfiles"
+
+# Хешированные имена файлов и предсжатые копии .gz/.br создаются при collectstatic
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "quiz_project.storage.CompressedManifestStaticFilesStorage",
+    },
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
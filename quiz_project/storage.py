@@ -0,0 +1,48 @@
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli необязателен
+    brotli = None
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Хранилище статики с хешами в именах файлов и предсжатыми копиями.
+
+    После `collectstatic` рядом с каждым текстовым файлом кладутся варианты
+    `.gz` и `.br` (если установлен brotli), которые отдаёт
+    `PrecompressedStaticMiddleware`.
+    """
+
+    # Шрифты woff2 и картинки уже сжаты, повторное сжатие их только увеличит
+    compressible_extensions = (".css", ".js", ".map", ".svg", ".ttf", ".txt", ".json")
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+
+        names = set(self.hashed_files) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if name.endswith(self.compressible_extensions) and self.exists(name):
+                self.compress(name)
+
+    def compress(self, name: str) -> None:
+        path = self.path(name)
+        with open(path, "rb") as source:
+            data = source.read()
+
+        self._write_variant(path + ".gz", data, gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            self._write_variant(path + ".br", data, brotli.compress(data, quality=11))
+
+    @staticmethod
+    def _write_variant(path: str, original: bytes, compressed: bytes) -> None:
+        # Сжатая копия, которая не меньше оригинала, бесполезна
+        if len(compressed) >= len(original):
+            return
+        with open(path, "wb") as target:
+            target.write(compressed)